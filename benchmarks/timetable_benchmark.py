@@ -0,0 +1,124 @@
+"""Benchmark headway-compressed timetables against per-minute hour lists.
+
+Run from the repository root:
+
+    python benchmarks/timetable_benchmark.py
+"""
+import json
+import os
+import random
+import re
+import sys
+import timeit
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPONENT_DIR = os.path.join(ROOT, "custom_components", "subway_timing")
+sys.path.insert(0, COMPONENT_DIR)
+
+from timetable import MINUTES_PER_DAY, HeadwayTimetable  # noqa: E402
+
+SAMPLE_FILE = os.path.join(COMPONENT_DIR, "config", "info-sample.conf")
+LOOKUPS = 20000
+
+
+def load_sample():
+    """读取示例时刻表中的第一张时刻表并去除重复班次，返回 {小时: [分钟]}."""
+    schedule = {}
+    with open(SAMPLE_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if schedule and not line:
+                break
+            if re.match(r"^\d+(\s+\d+)*$", line):
+                hour, *minutes = (int(part) for part in line.split())
+                schedule[hour] = sorted({minute for minute in minutes if 0 <= minute < 60})
+    return schedule
+
+
+def generate(seed, jitter):
+    """生成一张全天时刻表，高峰 3 分钟、平峰 6 分钟、早晚 8 分钟一班，部分班次随机偏移."""
+    rng = random.Random(seed)
+    minutes = []
+    for start, end, headway in ((330, 420, 8), (420, 570, 3), (570, 1020, 6),
+                                (1020, 1170, 3), (1170, 1410, 8)):
+        minutes.extend(range(start, end, headway))
+    minutes = sorted({
+        minute + (rng.choice((-1, 1)) if rng.random() < jitter else 0)
+        for minute in minutes
+    })
+    schedule = {}
+    for minute in minutes:
+        schedule.setdefault(minute // 60, []).append(minute % 60)
+    return schedule
+
+
+def hour_lookup(schedule, minute_of_day, count=3):
+    """原实现：按小时遍历并排序分钟列表."""
+    current_hour, current_minute = divmod(minute_of_day, 60)
+    result = []
+    for hour in list(range(current_hour, 24)) + list(range(0, current_hour)):
+        if hour in schedule:
+            for minute in sorted(schedule[hour]):
+                if hour == current_hour and minute <= current_minute:
+                    continue
+                result.append(hour * 60 + minute)
+                if len(result) >= count:
+                    return result
+    return result
+
+
+def headway_lookup(timetable, minute_of_day, count=3):
+    """压缩实现：段内算术定位."""
+    result = timetable.take(minute_of_day + 1, MINUTES_PER_DAY, count)
+    result.extend(timetable.take(0, minute_of_day // 60 * 60, count - len(result)))
+    return result
+
+
+def allocated(factory):
+    """测量构建数据结构占用的内存（字节）."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    value = factory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del value
+    return size
+
+
+def run(name, schedule):
+    """比较两种表示的内存、序列化大小和查询速度."""
+    minutes = sorted({hour * 60 + minute for hour, mins in schedule.items() for minute in mins})
+    timetable = HeadwayTimetable(minutes)
+
+    for minute in range(MINUTES_PER_DAY):
+        assert hour_lookup(schedule, minute) == headway_lookup(timetable, minute), minute
+
+    rng = random.Random(0)
+    queries = [rng.randrange(MINUTES_PER_DAY) for _ in range(LOOKUPS)]
+
+    hour_memory = allocated(lambda: {hour: list(mins) for hour, mins in schedule.items()})
+    headway_memory = allocated(lambda: HeadwayTimetable(minutes))
+    hour_json = len(json.dumps(minutes, separators=(",", ":")))
+    headway_json = len(json.dumps(timetable.as_segments(), separators=(",", ":")))
+    hour_time = min(timeit.repeat(
+        lambda: [hour_lookup(schedule, minute) for minute in queries], number=1, repeat=5))
+    headway_time = min(timeit.repeat(
+        lambda: [headway_lookup(timetable, minute) for minute in queries], number=1, repeat=5))
+
+    print(f"{name}: {len(minutes)} 班次, {len(timetable.as_segments())} 段")
+    print(f"  内存      {hour_memory:>8} B -> {headway_memory:>8} B")
+    print(f"  JSON      {hour_json:>8} B -> {headway_json:>8} B")
+    print(f"  查询 x{LOOKUPS} {hour_time * 1000:>7.1f} ms -> {headway_time * 1000:>7.1f} ms")
+
+
+def main():
+    """运行基准测试."""
+    run("示例时刻表", load_sample())
+    run("生成时刻表（规则）", generate(0, 0.0))
+    run("生成时刻表（10% 偏移）", generate(0, 0.1))
+
+
+if __name__ == "__main__":
+    main()
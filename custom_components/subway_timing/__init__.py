@@ -1,30 +1,207 @@
 """Subway timing component for Home Assistant."""
 import logging
+import os
+from datetime import timedelta
 
+import voluptuous as vol
+
+from homeassistant.auth.permissions.const import POLICY_CONTROL
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse, callback
+from homeassistant.exceptions import Unauthorized, UnknownUser
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.util import dt as dt_util
 
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    CONF_STATION,
+    CONF_DIRECTION,
+    CONF_TARGETS,
+    DATA_PARSERS,
+    SERVICE_REFRESH,
+    SIGNAL_TIMETABLE_UPDATED,
+    SIGNAL_OPTIONS_UPDATED,
+    CONF_SENSOR_MODE,
+    DEFAULT_SENSOR_MODE,
+    CONF_DEPARTURE,
+    CONF_DATE,
+    CONF_DELAY,
+    CONF_CANCELLED,
+    DEFAULT_OVERLAY_PATH,
+    OVERLAY_SCAN_INTERVAL,
+    SERVICE_SET_DELAY,
+    SERVICE_CLEAR_DELAYS,
+    SERVICE_PROFILE,
+    CONF_DURATION,
+    CONF_TOP,
+    DEFAULT_PROFILE_DURATION,
+    DEFAULT_PROFILE_TOP,
+)
+from .overlay import async_get_overlay, scheduled_time
+from .profiler import async_profile
+from .view import SubwayTimetableView
 
 _LOGGER = logging.getLogger(__name__)
 
 # 定义平台
 PLATFORMS = ["sensor"]
 
+REFRESH_SCHEMA = vol.Schema({
+    vol.Optional(CONF_STATION): cv.string,
+    vol.Optional(CONF_DIRECTION): cv.string,
+})
+
+SET_DELAY_SCHEMA = vol.Schema({
+    vol.Required(CONF_STATION): cv.string,
+    vol.Required(CONF_DIRECTION): cv.string,
+    vol.Required(CONF_DEPARTURE): cv.time,
+    vol.Optional(CONF_DATE): cv.date,
+    vol.Optional(CONF_DELAY, default=0): vol.All(vol.Coerce(int), vol.Range(min=0)),
+    vol.Optional(CONF_CANCELLED, default=False): cv.boolean,
+})
+
+PROFILE_SCHEMA = vol.Schema({
+    vol.Optional(CONF_DURATION, default=DEFAULT_PROFILE_DURATION): vol.All(
+        vol.Coerce(int), vol.Range(min=1, max=600)),
+    vol.Optional(CONF_TOP, default=DEFAULT_PROFILE_TOP): vol.All(
+        vol.Coerce(int), vol.Range(min=1, max=200)),
+})
+
 async def async_setup(hass, config):
     """Set up the Subway Timing component."""
     hass.data.setdefault(DOMAIN, {})
+    hass.http.register_view(SubwayTimetableView())
+
+    async def async_handle_refresh(call: ServiceCall) -> None:
+        """重新加载时刻表并刷新传感器."""
+        changed = False
+        for parser in list(hass.data[DOMAIN].get(DATA_PARSERS, {}).values()):
+            changed |= await hass.async_add_executor_job(parser.is_stale)
+            await hass.async_add_executor_job(parser.reload)
+
+        # 时刻表文件有变化时所有传感器都需要刷新，包括没有定时更新的传感器
+        if changed:
+            async_dispatcher_send(hass, SIGNAL_TIMETABLE_UPDATED, None, None)
+            return
+
+        async_dispatcher_send(
+            hass,
+            SIGNAL_TIMETABLE_UPDATED,
+            call.data.get(CONF_STATION),
+            call.data.get(CONF_DIRECTION),
+        )
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_REFRESH, async_handle_refresh, schema=REFRESH_SCHEMA
+    )
+
+    overlay = async_get_overlay(hass)
+    overlay_path = os.path.join(hass.config.config_dir, DEFAULT_OVERLAY_PATH)
+
+    @callback
+    def async_notify_affected(affected):
+        """只刷新受延误变化影响的传感器."""
+        for station, direction in affected:
+            async_dispatcher_send(hass, SIGNAL_TIMETABLE_UPDATED, station, direction)
+
+    async def async_handle_set_delay(call: ServiceCall) -> None:
+        """设置单趟列车的延误或停运."""
+        scheduled = scheduled_time(
+            call.data.get(CONF_DATE, dt_util.now().date()), call.data[CONF_DEPARTURE])
+        async_notify_affected(overlay.set_delay(
+            call.data[CONF_STATION],
+            call.data[CONF_DIRECTION],
+            scheduled,
+            call.data[CONF_DELAY],
+            call.data[CONF_CANCELLED],
+        ))
+
+    async def async_handle_clear_delays(call: ServiceCall) -> None:
+        """清除通过服务设置的延误."""
+        async_notify_affected(overlay.clear(
+            call.data.get(CONF_STATION), call.data.get(CONF_DIRECTION)))
+
+    async def async_check_overlay_file(now=None) -> None:
+        """延误文件变化时重新加载."""
+        data = await hass.async_add_executor_job(
+            overlay.read_file_if_changed, overlay_path)
+        if data is not None:
+            async_notify_affected(overlay.load_file_data(data))
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_SET_DELAY, async_handle_set_delay, schema=SET_DELAY_SCHEMA
+    )
+    hass.services.async_register(
+        DOMAIN, SERVICE_CLEAR_DELAYS, async_handle_clear_delays, schema=REFRESH_SCHEMA
+    )
+
+    async def async_handle_profile(call: ServiceCall):
+        """采集本集成的性能分析数据，仅管理员可调用."""
+        if call.context.user_id:
+            user = await hass.auth.async_get_user(call.context.user_id)
+            if user is None:
+                raise UnknownUser(
+                    context=call.context,
+                    permission=POLICY_CONTROL,
+                    user_id=call.context.user_id,
+                )
+            if not user.is_admin:
+                raise Unauthorized(context=call.context, permission=POLICY_CONTROL)
+
+        return await async_profile(hass, call.data[CONF_DURATION], call.data[CONF_TOP])
+
+    # 自行检查管理员权限：较早版本的 async_register_admin_service 不支持服务响应
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PROFILE,
+        async_handle_profile,
+        schema=PROFILE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    await async_check_overlay_file()
+    async_track_time_interval(
+        hass, async_check_overlay_file, timedelta(seconds=OVERLAY_SCAN_INTERVAL)
+    )
     return True
 
+def get_entry_targets(data):
+    """返回配置条目中的(站点, 方向)列表，兼容单个和批量添加的条目."""
+    if CONF_TARGETS in data:
+        return [tuple(target) for target in data[CONF_TARGETS]]
+    if data.get(CONF_STATION) and data.get(CONF_DIRECTION):
+        return [(data[CONF_STATION], data[CONF_DIRECTION])]
+    return []
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Subway Timing from a config entry."""
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = entry.data
+    hass.data[DOMAIN][entry.entry_id] = {
+        **entry.data,
+        CONF_SENSOR_MODE: entry.options.get(CONF_SENSOR_MODE, DEFAULT_SENSOR_MODE),
+    }
     
     # 设置平台
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    
+    # 监听选项变更
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
     return True
 
+async def async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Apply changed options, reloading the entry only if the sensor mode changed."""
+    sensor_mode = entry.options.get(CONF_SENSOR_MODE, DEFAULT_SENSOR_MODE)
+    if sensor_mode != hass.data[DOMAIN][entry.entry_id][CONF_SENSOR_MODE]:
+        await hass.config_entries.async_reload(entry.entry_id)
+        return
+
+    # 更新策略直接应用到已有传感器，无需重新加载
+    async_dispatcher_send(
+        hass, SIGNAL_OPTIONS_UPDATED.format(entry.entry_id), entry.options
+    )
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
@@ -13,45 +13,31 @@ from .const import (
     CONF_STATION, 
     CONF_DIRECTION, 
     CONF_CONFIG_PATH,
-    DEFAULT_CONFIG_PATH
+    DEFAULT_CONFIG_PATH,
+    CONF_SENSOR_MODE,
+    SENSOR_MODE_WAIT_TIME,
+    SENSOR_MODE_TIMESTAMP,
+    DEFAULT_SENSOR_MODE,
+    CONF_TARGETS,
+    CONF_UPDATE_MODE,
+    CONF_UPDATE_INTERVAL,
+    CONF_UPDATE_THRESHOLDS,
+    CONF_COALESCE_SLACK,
+    UPDATE_MODE_DYNAMIC,
+    UPDATE_MODE_FIXED,
+    UPDATE_MODE_EXACT,
+    UPDATE_MODE_CUSTOM,
+    DEFAULT_UPDATE_MODE,
+    DEFAULT_UPDATE_INTERVAL,
+    DEFAULT_UPDATE_THRESHOLDS,
+    DEFAULT_COALESCE_SLACK,
 )
+from . import get_entry_targets
+from .scheduler import parse_thresholds
+from .sensor_parser import async_get_schedule_parser
 
 _LOGGER = logging.getLogger(__name__)
 
-# 直接定义SubwayScheduleParser的简化版本，避免导入问题
-def parse_stations(config_file):
-    """解析配置文件中的站点信息."""
-    stations = {}
-    try:
-        with open(config_file, "r", encoding="utf-8") as f:
-            content = f.readlines()
-        
-        current_station = None
-        current_direction = None
-        
-        for line in content:
-            line = line.strip()
-            
-            # 跳过空行和注释
-            if not line or line.startswith("//"):
-                continue
-            
-            # 检查是否是站点名行
-            if "方向" not in line and not line.startswith("周") and not line.startswith("小时") and not any(c.isdigit() for c in line):
-                current_station = line
-                if current_station not in stations:
-                    stations[current_station] = []
-                continue
-            
-            # 检查是否是方向行
-            if "方向" in line and current_station and line not in stations[current_station]:
-                current_direction = line
-                stations[current_station].append(current_direction)
-    except Exception as e:
-        _LOGGER.error("解析配置文件时出错: %s", str(e))
-    
-    return stations
-
 class SubwayTimingConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for Subway Timing."""
 
@@ -62,6 +48,7 @@ class SubwayTimingConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         self._stations = {}
         self._station = None
         self._config_path = DEFAULT_CONFIG_PATH
+        self._summary = {}
 
     async def async_step_user(self, user_input=None):
         """处理初始步骤."""
@@ -83,14 +70,19 @@ class SubwayTimingConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 _LOGGER.error("配置文件不存在: %s", conf_path)
             else:
                 try:
-                    # 解析配置文件获取站点信息
-                    self._stations = parse_stations(conf_path)
+                    # 获取共享的解析结果，在各流程步骤和流程之间复用
+                    parser = await async_get_schedule_parser(self.hass, conf_path)
+                    self._stations = {
+                        station: list(directions)
+                        for station, directions in parser.get_stations().items()
+                    }
+                    self._summary = parser.get_summary()
                     
                     if not self._stations:
                         errors[CONF_CONFIG_PATH] = "no_stations_found"
                         _LOGGER.error("配置文件中未找到站点信息")
                     else:
-                        return await self.async_step_station()
+                        return await self.async_step_pick()
                 except Exception as e:
                     _LOGGER.error("解析配置文件时出错: %s", str(e))
                     errors[CONF_CONFIG_PATH] = "parse_error"
@@ -103,6 +95,59 @@ class SubwayTimingConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             errors=errors
         )
 
+    async def async_step_pick(self, user_input=None):
+        """选择逐个添加或批量添加."""
+        return self.async_show_menu(
+            step_id="pick",
+            menu_options=["station", "bulk"],
+            description_placeholders=self._summary_placeholders(),
+        )
+
+    async def async_step_bulk(self, user_input=None):
+        """处理批量选择站点和方向的步骤."""
+        errors = {}
+        configured = self._configured_targets()
+        targets = {
+            f"{station}_{direction}": (station, direction)
+            for station, directions in self._stations.items()
+            for direction in directions
+            if (station, direction) not in configured
+        }
+        
+        if not targets:
+            return self.async_abort(reason="all_configured")
+        
+        if user_input is not None:
+            selected = [targets[key] for key in user_input[CONF_TARGETS] if key in targets]
+            
+            if not selected:
+                errors[CONF_TARGETS] = "no_selection"
+            elif len(selected) == 1:
+                station, direction = selected[0]
+                return await self._async_create_station_entry(station, direction)
+            else:
+                # 选中的站点和方向保存在同一个配置条目中，每个生成一个传感器
+                station, direction = selected[0]
+                return self.async_create_entry(
+                    title=f"{station} {direction} 等 {len(selected)} 个方向",
+                    data={
+                        CONF_CONFIG_PATH: self._config_path,
+                        CONF_TARGETS: [list(target) for target in selected],
+                    }
+                )
+        
+        return self.async_show_form(
+            step_id="bulk",
+            data_schema=vol.Schema({
+                vol.Required(CONF_TARGETS, default=[]): cv.multi_select({
+                    key: f"{station} {direction}"
+                    for key, (station, direction) in targets.items()
+                }),
+            }),
+            errors=errors,
+            description_placeholders=self._summary_placeholders(),
+        )
+
     async def async_step_station(self, user_input=None):
         """处理站点选择步骤."""
         errors = {}
@@ -129,21 +174,7 @@ class SubwayTimingConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         
         if user_input is not None:
             direction = user_input[CONF_DIRECTION]
-            
-            # 创建唯一ID
-            unique_id = f"{self._station}_{direction}"
-            await self.async_set_unique_id(unique_id)
-            self._abort_if_unique_id_configured()
-            
-            # 创建配置条目
-            return self.async_create_entry(
-                title=f"{self._station} {direction}",
-                data={
-                    CONF_CONFIG_PATH: self._config_path,
-                    CONF_STATION: self._station,
-                    CONF_DIRECTION: direction,
-                }
-            )
+            return await self._async_create_station_entry(self._station, direction)
         
         # 准备方向选择选项
         directions = self._stations.get(self._station, [])
@@ -157,6 +188,41 @@ class SubwayTimingConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             description_placeholders={"station": self._station}
         )
 
+    async def _async_create_station_entry(self, station, direction):
+        """为站点和方向创建配置条目."""
+        # 创建唯一ID
+        unique_id = f"{station}_{direction}"
+        await self.async_set_unique_id(unique_id)
+        self._abort_if_unique_id_configured()
+        if (station, direction) in self._configured_targets():
+            return self.async_abort(reason="already_configured")
+        
+        # 创建配置条目
+        return self.async_create_entry(
+            title=f"{station} {direction}",
+            data={
+                CONF_CONFIG_PATH: self._config_path,
+                CONF_STATION: station,
+                CONF_DIRECTION: direction,
+            }
+        )
+
+    def _configured_targets(self):
+        """返回所有配置条目中已添加的(站点, 方向)."""
+        configured = set()
+        for entry in self._async_current_entries():
+            for station, direction in get_entry_targets(entry.data):
+                configured.add((station, direction))
+        return configured
+
+    def _summary_placeholders(self):
+        """返回时刻表概况的描述占位符."""
+        return {
+            "stations": str(self._summary.get("stations", 0)),
+            "directions": str(self._summary.get("directions", 0)),
+            "departures": str(self._summary.get("departures", 0)),
+        }
+
     @staticmethod
     @callback
     def async_get_options_flow(config_entry):
@@ -173,18 +239,48 @@ class SubwayTimingOptionsFlowHandler(config_entries.OptionsFlow):
 
     async def async_step_init(self, user_input=None):
         """处理选项流程."""
+        errors = {}
+        
         if user_input is not None:
-            return self.async_create_entry(title="", data=user_input)
+            try:
+                parse_thresholds(user_input[CONF_UPDATE_THRESHOLDS])
+            except vol.Invalid as e:
+                _LOGGER.error("阈值表无效: %s", str(e))
+                errors[CONF_UPDATE_THRESHOLDS] = "invalid_thresholds"
+            else:
+                return self.async_create_entry(title="", data=user_input)
 
         options = {
             vol.Optional(
-                "update_mode",
-                default=self.config_entry.options.get("update_mode", "dynamic"),
-            ): vol.In({"dynamic": "动态更新", "fixed": "固定间隔"}),
+                CONF_SENSOR_MODE,
+                default=self.config_entry.options.get(CONF_SENSOR_MODE, DEFAULT_SENSOR_MODE),
+            ): vol.In({
+                SENSOR_MODE_WAIT_TIME: "等待分钟数",
+                SENSOR_MODE_TIMESTAMP: "发车时间戳",
+            }),
+            vol.Optional(
+                CONF_UPDATE_MODE,
+                default=self.config_entry.options.get(CONF_UPDATE_MODE, DEFAULT_UPDATE_MODE),
+            ): vol.In({
+                UPDATE_MODE_DYNAMIC: "动态更新",
+                UPDATE_MODE_FIXED: "固定间隔",
+                UPDATE_MODE_EXACT: "仅在状态变化时更新",
+                UPDATE_MODE_CUSTOM: "自定义阈值表",
+            }),
             vol.Optional(
-                "update_interval",
-                default=self.config_entry.options.get("update_interval", 60),
+                CONF_UPDATE_INTERVAL,
+                default=self.config_entry.options.get(CONF_UPDATE_INTERVAL, DEFAULT_UPDATE_INTERVAL),
             ): vol.All(vol.Coerce(int), vol.Range(min=10, max=600)),
+            vol.Optional(
+                CONF_UPDATE_THRESHOLDS,
+                default=self.config_entry.options.get(
+                    CONF_UPDATE_THRESHOLDS, DEFAULT_UPDATE_THRESHOLDS),
+            ): str,
+            vol.Optional(
+                CONF_COALESCE_SLACK,
+                default=self.config_entry.options.get(CONF_COALESCE_SLACK, DEFAULT_COALESCE_SLACK),
+            ): vol.All(vol.Coerce(int), vol.Range(min=0, max=60)),
         }
 
-        return self.async_show_form(step_id="init", data_schema=vol.Schema(options))
+        return self.async_show_form(
+            step_id="init", data_schema=vol.Schema(options), errors=errors)
@@ -5,8 +5,41 @@ DEFAULT_NAME = "Subway Timing"
 CONF_STATION = "station"
 CONF_DIRECTION = "direction"
 CONF_CONFIG_PATH = "config_path"
+CONF_TARGETS = "targets"
+CONF_DEPARTURE = "departure"
+CONF_DATE = "date"
+CONF_DELAY = "delay"
+CONF_CANCELLED = "cancelled"
+CONF_DURATION = "duration"
+CONF_TOP = "top"
+DEFAULT_PROFILE_DURATION = 60
+DEFAULT_PROFILE_TOP = 20
+DEFAULT_OVERLAY_PATH = "custom_components/subway_timing/config/delays.json"
+# 检查延误文件变化的间隔（秒）
+OVERLAY_SCAN_INTERVAL = 30
 DEFAULT_CONFIG_PATH = "custom_components/subway_timing/config/info.conf"
 
+# 传感器模式
+CONF_SENSOR_MODE = "sensor_mode"
+SENSOR_MODE_WAIT_TIME = "wait_time"
+SENSOR_MODE_TIMESTAMP = "timestamp"
+DEFAULT_SENSOR_MODE = SENSOR_MODE_WAIT_TIME
+
+# 更新策略
+CONF_UPDATE_MODE = "update_mode"
+CONF_UPDATE_INTERVAL = "update_interval"
+CONF_UPDATE_THRESHOLDS = "update_thresholds"
+CONF_COALESCE_SLACK = "coalesce_slack"
+UPDATE_MODE_DYNAMIC = "dynamic"
+UPDATE_MODE_FIXED = "fixed"
+UPDATE_MODE_EXACT = "exact"
+UPDATE_MODE_CUSTOM = "custom"
+DEFAULT_UPDATE_MODE = UPDATE_MODE_DYNAMIC
+DEFAULT_UPDATE_INTERVAL = 60
+# 等待时间(秒):更新间隔(秒)，最后一项为默认更新间隔
+DEFAULT_UPDATE_THRESHOLDS = "60:10, 300:30, 900:60, 1800:120, 300"
+DEFAULT_COALESCE_SLACK = 5
+
 # 属性常量
 ATTR_STATION = "station"
 ATTR_DIRECTION = "direction"
@@ -22,6 +55,24 @@ ATTR_NEXT_TRAIN_3_TIME = "next_train_3_time"
 ATTR_NEXT_TRAIN_1_WAIT = "next_train_1_wait"
 ATTR_NEXT_TRAIN_2_WAIT = "next_train_2_wait"
 ATTR_NEXT_TRAIN_3_WAIT = "next_train_3_wait"
+ATTR_DEPARTURE_TIME = "departure_time"
+ATTR_DEPARTURE = "departure"
 
 # 服务常量
 SERVICE_REFRESH = "refresh"
+SERVICE_SET_DELAY = "set_delay"
+SERVICE_CLEAR_DELAYS = "clear_delays"
+SERVICE_PROFILE = "profile"
+
+# 共享数据与信号
+DATA_PARSERS = "parsers"
+DATA_SCHEDULER = "scheduler"
+DATA_OVERLAY = "overlay"
+DATA_PROFILING = "profiling"
+SIGNAL_TIMETABLE_UPDATED = f"{DOMAIN}_timetable_updated"
+SIGNAL_OPTIONS_UPDATED = f"{DOMAIN}_options_updated_{{}}"
+
+# 时刻表数据接口
+TIMETABLE_URL = f"/api/{DOMAIN}/timetable"
+TIMETABLE_VIEW_NAME = f"api:{DOMAIN}:timetable"
+TIMETABLE_BUNDLE_VERSION = 2
@@ -0,0 +1,210 @@
+"""Real-time delay overlay for the static subway schedule."""
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from homeassistant.core import callback
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    DOMAIN,
+    DATA_OVERLAY,
+    CONF_DEPARTURE,
+    CONF_DATE,
+    CONF_DELAY,
+    CONF_CANCELLED,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# 过期补丁的保留时间
+PATCH_RETENTION = timedelta(days=1)
+
+
+@callback
+def async_get_overlay(hass):
+    """获取共享的延误覆盖层."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if DATA_OVERLAY not in domain_data:
+        domain_data[DATA_OVERLAY] = DelayOverlay()
+    return domain_data[DATA_OVERLAY]
+
+
+def scheduled_time(day, departure):
+    """将日期和发车时刻组合为当地时间."""
+    return dt_util.start_of_local_day(day).replace(
+        hour=departure.hour, minute=departure.minute)
+
+
+class DelayOverlay:
+    """按(站点, 方向)保存延误和停运补丁，查询时叠加到静态时刻表上.
+
+    补丁以计划发车时间为键，来源分为服务调用和本地文件两层，服务调用的补丁优先。
+    基础时刻表不需要重新解析，查询开销只与该方向的补丁数量有关。
+    """
+
+    def __init__(self):
+        """初始化覆盖层."""
+        self._service = {}
+        self._file = {}
+        self._patches = {}
+        self._file_mtime = None
+
+    def get_next_times(self, parser, station, direction, current_time=None, count=3):
+        """获取叠加延误后的接下来几趟列车时间."""
+        if current_time is None:
+            current_time = dt_util.now()
+
+        patches = self._patches.get((station, direction))
+        if not patches:
+            return parser.get_next_times(station, direction, current_time, count)
+
+        # 停运的列车会被移除，多取相应趟数
+        base_times = parser.get_next_times(
+            station, direction, current_time, count + len(patches))
+
+        next_times = []
+        for train_time in base_times:
+            delay, cancelled = patches.get(train_time, (0, False))
+            if not cancelled:
+                next_times.append(train_time + timedelta(minutes=delay))
+
+        # 计划时间已过但晚点后仍未发车的列车；晚于查询窗口的补丁不可能进入前几趟
+        base_set = set(base_times)
+        for scheduled, (delay, cancelled) in patches.items():
+            if (
+                cancelled
+                or scheduled in base_set
+                or (base_times and scheduled > base_times[-1])
+                or scheduled + timedelta(minutes=delay) <= current_time
+            ):
+                continue
+            if parser.has_departure(station, direction, scheduled):
+                next_times.append(scheduled + timedelta(minutes=delay))
+
+        next_times.sort()
+        return next_times[:count]
+
+    def set_delay(self, station, direction, scheduled, delay=0, cancelled=False):
+        """通过服务调用设置单趟列车的延误或停运，返回受影响的(站点, 方向)."""
+        key = (station, direction)
+        self._service.setdefault(key, {})[scheduled] = (delay, cancelled)
+        affected = self._prune() | {key}
+        self._merge(key)
+        return affected
+
+    def clear(self, station=None, direction=None):
+        """清除服务调用设置的补丁，返回受影响的(站点, 方向)."""
+        affected = {
+            key for key in self._service
+            if (station is None or key[0] == station)
+            and (direction is None or key[1] == direction)
+        }
+        for key in affected:
+            del self._service[key]
+            self._merge(key)
+        return affected
+
+    def read_file_if_changed(self, path):
+        """读取变化后的延误文件，未变化时返回 None，文件被删除时返回空字典."""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+
+        if mtime == self._file_mtime:
+            return None
+        self._file_mtime = mtime
+
+        if mtime is None:
+            return {}
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            _LOGGER.error("读取延误文件 %s 时出错：%s", path, str(e))
+            return None
+
+    def load_file_data(self, data):
+        """用文件内容替换文件来源的补丁，返回受影响的(站点, 方向)."""
+        today = dt_util.now().date()
+        file_patches = {}
+
+        if not isinstance(data, dict):
+            _LOGGER.error("延误文件格式错误，顶层应为以站点为键的对象")
+            data = {}
+
+        for station, directions in data.items():
+            if not isinstance(directions, dict):
+                _LOGGER.error("站点 %s 的延误格式错误，应为以方向为键的对象", station)
+                continue
+            for direction, entries in directions.items():
+                if not isinstance(entries, list):
+                    _LOGGER.error("站点 %s %s 的延误格式错误，应为列表", station, direction)
+                    continue
+                patches = {}
+                for entry in entries:
+                    if not isinstance(entry, dict):
+                        _LOGGER.error("延误条目格式错误：%s", entry)
+                        continue
+                    try:
+                        departure = datetime.strptime(
+                            entry[CONF_DEPARTURE], "%H:%M").time()
+                        day = (
+                            datetime.strptime(entry[CONF_DATE], "%Y-%m-%d").date()
+                            if CONF_DATE in entry else today
+                        )
+                        delay = int(entry.get(CONF_DELAY, 0))
+                    except (KeyError, TypeError, ValueError) as e:
+                        _LOGGER.error("延误条目格式错误 %s：%s", entry, str(e))
+                        continue
+                    if delay < 0:
+                        _LOGGER.error("延误分钟数不能为负数：%s", entry)
+                        continue
+                    patches[scheduled_time(day, departure)] = (
+                        delay, bool(entry.get(CONF_CANCELLED, False)))
+                if patches:
+                    file_patches[(station, direction)] = patches
+
+        affected = {
+            key for key in set(self._file) | set(file_patches)
+            if self._file.get(key) != file_patches.get(key)
+        }
+        self._file = file_patches
+        affected |= self._prune()
+        for key in affected:
+            self._merge(key)
+        return affected
+
+    def _prune(self):
+        """移除已经过期的补丁，返回受影响的(站点, 方向)."""
+        cutoff = dt_util.now() - PATCH_RETENTION
+        affected = set()
+
+        for layer in (self._service, self._file):
+            for key in list(layer):
+                patches = layer[key]
+                expired = [
+                    scheduled for scheduled, (delay, _) in patches.items()
+                    if scheduled + timedelta(minutes=delay) < cutoff
+                ]
+                for scheduled in expired:
+                    del patches[scheduled]
+                if expired:
+                    affected.add(key)
+                if not patches:
+                    del layer[key]
+
+        for key in affected:
+            self._merge(key)
+        return affected
+
+    def _merge(self, key):
+        """合并两层补丁，服务调用的补丁覆盖文件中的补丁."""
+        merged = {**self._file.get(key, {}), **self._service.get(key, {})}
+        if merged:
+            self._patches[key] = merged
+        else:
+            self._patches.pop(key, None)
@@ -0,0 +1,175 @@
+"""On-demand profiling of the Subway Timing integration."""
+import asyncio
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import tracemalloc
+
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, DATA_PARSERS, DATA_PROFILING
+from .sensor_parser import SubwayScheduleParser
+
+_LOGGER = logging.getLogger(__name__)
+
+# 只统计本集成目录下的代码
+INTEGRATION_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Python 3.12 起 cProfile 基于解释器全局的 sys.monitoring，可以采集执行器线程，
+# 且同一时间只能启用一个分析器；更早的版本只采集启用分析器的线程
+PROFILE_ALL_THREADS = sys.version_info >= (3, 12)
+
+
+async def async_profile(hass, duration, top):
+    """在限定时间内采集本集成的 cProfile 和 tracemalloc 数据.
+
+    事件循环线程上的查询、调度代码在整个时段内采集；解析在执行器中运行，
+    因此在时段开始时于执行器中重新解析一次全部时刻表文件。
+    结果只保留本集成的代码，写入配置目录，并返回耗时和内存占用前 top 项。
+    """
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if domain_data.get(DATA_PROFILING):
+        raise HomeAssistantError("已有性能分析正在进行")
+
+    domain_data[DATA_PROFILING] = True
+    profiler = cProfile.Profile()
+    started_tracing = not tracemalloc.is_tracing()
+    parse_profiler = None
+
+    try:
+        _enable_profiler(profiler)
+
+        if started_tracing:
+            tracemalloc.start()
+
+        try:
+            config_files = [
+                parser.config_file
+                for parser in hass.data[DOMAIN].get(DATA_PARSERS, {}).values()
+            ]
+            parse_profiler = await hass.async_add_executor_job(
+                _profile_parse, config_files)
+            await asyncio.sleep(duration)
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+    finally:
+        domain_data[DATA_PROFILING] = False
+
+    snapshot = snapshot.filter_traces(
+        [tracemalloc.Filter(True, os.path.join(INTEGRATION_DIR, "*"))])
+
+    base_path = os.path.join(
+        hass.config.config_dir,
+        f"{DOMAIN}_profile_{dt_util.now().strftime('%Y%m%d_%H%M%S')}",
+    )
+    functions, memory = await hass.async_add_executor_job(
+        _write_results, profiler, parse_profiler, snapshot, base_path, top)
+
+    _LOGGER.info("性能分析结果已写入 %s.prof 和 %s.txt", base_path, base_path)
+
+    return {
+        "duration": duration,
+        "profile_file": f"{base_path}.prof",
+        "report_file": f"{base_path}.txt",
+        "functions": functions,
+        "memory": memory,
+    }
+
+
+def _enable_profiler(profiler):
+    """启用分析器，其他分析工具占用时抛出 HomeAssistantError."""
+    try:
+        profiler.enable()
+    except ValueError as err:
+        raise HomeAssistantError(f"无法启动 cProfile: {err}") from err
+
+
+def _profile_parse(config_files):
+    """在执行器线程中解析时刻表文件.
+
+    Python 3.12 及以上由事件循环线程上已启用的分析器直接采集，返回 None；
+    更早的版本在执行器线程中另外启用一个分析器并返回它。
+    """
+    if PROFILE_ALL_THREADS:
+        for config_file in config_files:
+            SubwayScheduleParser(config_file)
+        return None
+
+    profiler = cProfile.Profile()
+    _enable_profiler(profiler)
+    try:
+        for config_file in config_files:
+            SubwayScheduleParser(config_file)
+    finally:
+        profiler.disable()
+    return profiler
+
+
+def _is_integration_code(function):
+    """判断 pstats 中的函数是否属于本集成."""
+    return function[0].startswith(INTEGRATION_DIR)
+
+
+def _write_results(profiler, parse_profiler, snapshot, base_path, top):
+    """写入分析结果文件，返回耗时和内存占用前 top 项."""
+    stats = pstats.Stats(profiler)
+    if parse_profiler is not None:
+        stats.add(parse_profiler)
+
+    # 只保留本集成的函数及其之间的调用关系
+    stats.stats = {
+        function: (cc, calls, total_time, cumulative_time, {
+            caller: value
+            for caller, value in callers.items()
+            if _is_integration_code(caller)
+        })
+        for function, (cc, calls, total_time, cumulative_time, callers)
+        in stats.stats.items()
+        if _is_integration_code(function)
+    }
+    stats.dump_stats(f"{base_path}.prof")
+
+    functions = [
+        {
+            "function": f"{os.path.relpath(filename, INTEGRATION_DIR)}:{lineno}({name})",
+            "calls": calls,
+            "total_time": round(total_time, 6),
+            "cumulative_time": round(cumulative_time, 6),
+        }
+        for (filename, lineno, name), (_, calls, total_time, cumulative_time, _)
+        in stats.stats.items()
+    ]
+    functions.sort(key=lambda item: item["cumulative_time"], reverse=True)
+    functions = functions[:top]
+
+    memory = [
+        {
+            "location": (
+                f"{os.path.relpath(stat.traceback[0].filename, INTEGRATION_DIR)}"
+                f":{stat.traceback[0].lineno}"
+            ),
+            "size_kib": round(stat.size / 1024, 1),
+            "count": stat.count,
+        }
+        for stat in snapshot.statistics("lineno")[:top]
+    ]
+
+    with open(f"{base_path}.txt", "w", encoding="utf-8") as f:
+        f.write("函数耗时（按累计时间排序）\n")
+        f.write(f"{'调用次数':>10} {'自身耗时':>12} {'累计耗时':>12}  函数\n")
+        for item in functions:
+            f.write(
+                f"{item['calls']:>10} {item['total_time']:>12.6f} "
+                f"{item['cumulative_time']:>12.6f}  {item['function']}\n"
+            )
+        f.write("\n内存占用（按分配大小排序）\n")
+        for item in memory:
+            f.write(f"{item['size_kib']:>10.1f} KiB {item['count']:>8}  {item['location']}\n")
+
+    return functions, memory
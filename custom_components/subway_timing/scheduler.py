@@ -0,0 +1,186 @@
+"""Update scheduling for Subway Timing sensors."""
+import logging
+from datetime import timedelta
+from functools import partial
+
+import voluptuous as vol
+
+from homeassistant.core import HassJob, callback
+from homeassistant.helpers.event import async_track_point_in_utc_time
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    DOMAIN,
+    DATA_SCHEDULER,
+    CONF_UPDATE_MODE,
+    CONF_UPDATE_INTERVAL,
+    CONF_UPDATE_THRESHOLDS,
+    CONF_COALESCE_SLACK,
+    UPDATE_MODE_FIXED,
+    UPDATE_MODE_EXACT,
+    UPDATE_MODE_CUSTOM,
+    DEFAULT_UPDATE_MODE,
+    DEFAULT_UPDATE_INTERVAL,
+    DEFAULT_UPDATE_THRESHOLDS,
+    DEFAULT_COALESCE_SLACK,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def parse_thresholds(value):
+    """解析阈值表，例如 "60:10, 300:30, 300".
+
+    每一项为 等待时间(秒):更新间隔(秒)，最后一项为超过所有阈值时的更新间隔。
+    """
+    thresholds = []
+    default = None
+    items = [item.strip() for item in str(value).split(",") if item.strip()]
+
+    if not items:
+        raise vol.Invalid("阈值表不能为空")
+
+    for index, item in enumerate(items):
+        try:
+            if ":" in item:
+                wait, interval = (int(part) for part in item.split(":", 1))
+                thresholds.append((wait, interval))
+            elif index == len(items) - 1:
+                default = interval = int(item)
+            else:
+                raise vol.Invalid(f"阈值项格式错误: {item}")
+        except ValueError as err:
+            raise vol.Invalid(f"阈值项格式错误: {item}") from err
+
+        if interval <= 0:
+            raise vol.Invalid(f"更新间隔必须大于0: {item}")
+
+    thresholds.sort()
+    if default is None:
+        default = thresholds[-1][1]
+
+    return thresholds, default
+
+
+class ThresholdPolicy:
+    """根据下一班列车的等待时间查表确定更新间隔."""
+
+    def __init__(self, thresholds, default):
+        """初始化策略."""
+        self._thresholds = thresholds
+        self._default = default
+
+    def next_update(self, now, next_departure, transition):
+        """计算下一次更新时间."""
+        wait_seconds = (next_departure - now).total_seconds()
+        for max_wait, interval in self._thresholds:
+            if wait_seconds < max_wait:
+                return now + timedelta(seconds=interval)
+        return now + timedelta(seconds=self._default)
+
+
+class FixedPolicy:
+    """以固定间隔更新."""
+
+    def __init__(self, interval):
+        """初始化策略."""
+        self._interval = interval
+
+    def next_update(self, now, next_departure, transition):
+        """计算下一次更新时间."""
+        return now + timedelta(seconds=self._interval)
+
+
+class ExactTransitionPolicy:
+    """只在传感器状态实际发生变化的时刻更新."""
+
+    def next_update(self, now, next_departure, transition):
+        """计算下一次更新时间."""
+        return transition
+
+
+def build_policy(options):
+    """根据选项创建更新策略."""
+    mode = options.get(CONF_UPDATE_MODE, DEFAULT_UPDATE_MODE)
+
+    if mode == UPDATE_MODE_FIXED:
+        return FixedPolicy(options.get(CONF_UPDATE_INTERVAL, DEFAULT_UPDATE_INTERVAL))
+
+    if mode == UPDATE_MODE_EXACT:
+        return ExactTransitionPolicy()
+
+    if mode == UPDATE_MODE_CUSTOM:
+        try:
+            return ThresholdPolicy(*parse_thresholds(
+                options.get(CONF_UPDATE_THRESHOLDS, DEFAULT_UPDATE_THRESHOLDS)))
+        except vol.Invalid as err:
+            _LOGGER.error("阈值表无效，使用默认动态更新: %s", err)
+
+    return ThresholdPolicy(*parse_thresholds(DEFAULT_UPDATE_THRESHOLDS))
+
+
+def get_coalesce_slack(options):
+    """返回定时器合并的容差时间."""
+    return timedelta(seconds=options.get(CONF_COALESCE_SLACK, DEFAULT_COALESCE_SLACK))
+
+
+@callback
+def async_get_update_scheduler(hass):
+    """获取共享的更新调度器."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if DATA_SCHEDULER not in domain_data:
+        domain_data[DATA_SCHEDULER] = UpdateScheduler(hass)
+    return domain_data[DATA_SCHEDULER]
+
+
+class UpdateScheduler:
+    """合并相近的定时更新，让容差范围内到期的更新共用一次唤醒."""
+
+    def __init__(self, hass):
+        """初始化调度器."""
+        self._hass = hass
+        self._buckets = {}
+
+    @callback
+    def async_schedule(self, when, action, slack=timedelta(0)):
+        """安排在 when 到 when + slack 之间执行 action，返回取消函数."""
+        when = dt_util.as_utc(when)
+        latest = when + slack
+
+        fire_at = None
+        for bucket_time in self._buckets:
+            if when <= bucket_time <= latest and (fire_at is None or bucket_time < fire_at):
+                fire_at = bucket_time
+
+        if fire_at is None:
+            fire_at = when
+            self._buckets[fire_at] = {
+                "jobs": [],
+                "unsub": async_track_point_in_utc_time(
+                    self._hass, partial(self._async_fire, fire_at), fire_at),
+            }
+
+        job = HassJob(action)
+        self._buckets[fire_at]["jobs"].append(job)
+
+        @callback
+        def async_cancel():
+            """取消已安排的更新."""
+            bucket = self._buckets.get(fire_at)
+            if bucket is None or job not in bucket["jobs"]:
+                return
+            bucket["jobs"].remove(job)
+            if not bucket["jobs"]:
+                bucket["unsub"]()
+                del self._buckets[fire_at]
+
+        return async_cancel
+
+    @callback
+    def _async_fire(self, fire_at, now):
+        """执行同一次唤醒中的所有更新."""
+        bucket = self._buckets.pop(fire_at, None)
+        if bucket is None:
+            return
+        for job in bucket["jobs"]:
+            self._hass.async_run_hass_job(job, now)
@@ -1,13 +1,13 @@
 """Subway Timing Sensor for Home Assistant."""
 import os
 import logging
-import re
 from datetime import datetime, time, timedelta
 
 import voluptuous as vol
 
 from homeassistant.components.sensor import (
     PLATFORM_SCHEMA,
+    SensorDeviceClass,
     SensorEntity,
 )
 from homeassistant.const import CONF_NAME
@@ -15,7 +15,7 @@ import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.entity import Entity
 from homeassistant.util import dt as dt_util
 from homeassistant.core import callback
-from homeassistant.helpers.event import async_track_point_in_utc_time
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 
 from .const import (
     DOMAIN, 
@@ -24,8 +24,41 @@ from .const import (
     CONF_DIRECTION, 
     CONF_CONFIG_PATH,
     DEFAULT_CONFIG_PATH,
+    CONF_SENSOR_MODE,
+    SENSOR_MODE_WAIT_TIME,
+    SENSOR_MODE_TIMESTAMP,
+    DEFAULT_SENSOR_MODE,
+    CONF_TARGETS,
+    ATTR_STATION,
+    ATTR_DIRECTION,
+    ATTR_NEXT_TRAINS,
+    ATTR_LAST_UPDATED,
+    ATTR_DEPARTURE_TIME,
+    ATTR_DEPARTURE,
+    SIGNAL_TIMETABLE_UPDATED,
+    SIGNAL_OPTIONS_UPDATED,
+    CONF_UPDATE_MODE,
+    CONF_UPDATE_INTERVAL,
+    CONF_UPDATE_THRESHOLDS,
+    CONF_COALESCE_SLACK,
+    UPDATE_MODE_DYNAMIC,
+    UPDATE_MODE_FIXED,
+    UPDATE_MODE_EXACT,
+    UPDATE_MODE_CUSTOM,
+    DEFAULT_UPDATE_MODE,
+    DEFAULT_UPDATE_INTERVAL,
+    DEFAULT_UPDATE_THRESHOLDS,
+    DEFAULT_COALESCE_SLACK,
+)
+from . import get_entry_targets
+from .sensor_parser import async_get_schedule_parser
+from .overlay import async_get_overlay
+from .scheduler import (
+    ExactTransitionPolicy,
+    async_get_update_scheduler,
+    build_policy,
+    get_coalesce_slack,
 )
-from .sensor_parser import SubwayScheduleParser
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -36,15 +69,37 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         vol.Optional(CONF_CONFIG_PATH, default=DEFAULT_CONFIG_PATH): cv.string,
         vol.Optional(CONF_STATION): cv.string,
         vol.Optional(CONF_DIRECTION): cv.string,
+        vol.Optional(CONF_SENSOR_MODE, default=DEFAULT_SENSOR_MODE): vol.In(
+            [SENSOR_MODE_WAIT_TIME, SENSOR_MODE_TIMESTAMP]
+        ),
+        vol.Optional(CONF_UPDATE_MODE, default=DEFAULT_UPDATE_MODE): vol.In(
+            [UPDATE_MODE_DYNAMIC, UPDATE_MODE_FIXED, UPDATE_MODE_EXACT, UPDATE_MODE_CUSTOM]
+        ),
+        vol.Optional(CONF_UPDATE_INTERVAL, default=DEFAULT_UPDATE_INTERVAL): vol.All(
+            vol.Coerce(int), vol.Range(min=10, max=600)
+        ),
+        vol.Optional(CONF_UPDATE_THRESHOLDS, default=DEFAULT_UPDATE_THRESHOLDS): cv.string,
+        vol.Optional(CONF_COALESCE_SLACK, default=DEFAULT_COALESCE_SLACK): vol.All(
+            vol.Coerce(int), vol.Range(min=0, max=60)
+        ),
     }
 )
 
+
+def _get_sensor_class(sensor_mode):
+    """根据传感器模式返回实体类."""
+    if sensor_mode == SENSOR_MODE_TIMESTAMP:
+        return SubwayTimingTimestampSensor
+    return SubwayTimingSensor
+
+
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """通过YAML配置设置Subway Timing传感器."""
-    name = config.get(CONF_NAME)
     config_path = config.get(CONF_CONFIG_PATH)
     station = config.get(CONF_STATION)
     direction = config.get(CONF_DIRECTION)
+    name = config.get(CONF_NAME)
+    sensor_class = _get_sensor_class(config.get(CONF_SENSOR_MODE))
     
     # 读取配置文件路径
     # 检查配置文件是否为绝对路径
@@ -58,26 +113,22 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
         return
     
     # 解析配置文件
-    schedule_parser = SubwayScheduleParser(conf_path)
+    schedule_parser = await async_get_schedule_parser(hass, conf_path)
     stations = schedule_parser.get_stations()
     
     if not stations:
         _LOGGER.error("配置文件中未找到站点信息，请检查文件格式是否正确")
         return
     
-    # 创建协调器
-    coordinator = SubwayTimingUpdateCoordinator(hass, schedule_parser)
-    await coordinator.async_refresh()
-    
     entities = []
     
     # 如果指定了站点和方向，只添加指定的传感器
     if station and direction:
         if station in stations and direction in stations[station]:
             unique_id = f"subway_timing_{station}_{direction}"
-            entities.append(SubwayTimingSensor(
-                coordinator, f"{name} {station} {direction}",
-                station, direction, unique_id=unique_id))
+            entities.append(sensor_class(
+                schedule_parser, station, direction, unique_id=unique_id,
+                options=config, name=f"{name} {station} {direction}"))
         else:
             _LOGGER.error("找不到指定的站点或方向：%s %s", station, direction)
     else:
@@ -85,9 +136,10 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
         for station_name, directions in stations.items():
             for direction_name in directions:
                 unique_id = f"subway_timing_{station_name}_{direction_name}"
-                entities.append(SubwayTimingSensor(
-                    coordinator, f"{name} {station_name} {direction_name}",
-                    station_name, direction_name, unique_id=unique_id))
+                entities.append(sensor_class(
+                    schedule_parser, station_name, direction_name,
+                    unique_id=unique_id, options=config,
+                    name=f"{name} {station_name} {direction_name}"))
     
     async_add_entities(entities, True)
 
@@ -97,8 +149,10 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     config_path = config.get(CONF_CONFIG_PATH, DEFAULT_CONFIG_PATH)
     station = config.get(CONF_STATION)
     direction = config.get(CONF_DIRECTION)
+    sensor_class = _get_sensor_class(
+        config_entry.options.get(CONF_SENSOR_MODE, DEFAULT_SENSOR_MODE))
     
-    _LOGGER.debug("设置实体: 站点=%s, 方向=%s", station, direction)
+    _LOGGER.debug("设置实体: %s", get_entry_targets(config))
     
     # 读取配置文件路径
     # 检查配置文件是否为绝对路径
@@ -112,159 +166,32 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
         return
     
     # 解析配置文件并创建传感器
-    schedule_parser = SubwayScheduleParser(conf_path)
+    schedule_parser = await async_get_schedule_parser(hass, conf_path)
     
-    if station and direction:
-        entity = SubwayTimingSensor(
+    if CONF_TARGETS in config:
+        # 批量添加的条目为每个站点和方向创建一个传感器
+        stations = schedule_parser.get_stations()
+        entities = []
+        for station, direction in get_entry_targets(config):
+            if station not in stations or direction not in stations[station]:
+                _LOGGER.error("找不到指定的站点或方向：%s %s", station, direction)
+                continue
+            entities.append(sensor_class(
+                schedule_parser, station, direction,
+                f"{station}_{direction}", config_entry.entry_id, config_entry.options))
+        async_add_entities(entities, True)
+    elif station and direction:
+        entity = sensor_class(
             schedule_parser, station, direction, 
-            config_entry.unique_id, config_entry.entry_id)
+            config_entry.unique_id, config_entry.entry_id, config_entry.options)
         _LOGGER.debug("添加实体: %s", entity.name)
         async_add_entities([entity], True)
 
-class SubwayScheduleParser:
-    """解析地铁时刻表配置文件."""
-    # ... existing code ...
-    
-    def __init__(self, config_file):
-        """初始化解析器."""
-        self.config_file = config_file
-        self.stations = {}
-        self._parse_schedule()
-    
-    def _parse_schedule(self):
-        """解析时刻表文件."""
-        try:
-            with open(self.config_file, "r", encoding="utf-8") as f:
-                content = f.readlines()
-            
-            current_station = None
-            current_direction = None
-            current_days = None
-            current_hour = None
-            
-            for line in content:
-                line = line.strip()
-                
-                # 跳过空行和注释
-                if not line or line.startswith("//"):
-                    continue
-                
-                # 检查是否是站点名行
-                if not line.startswith("小时 |") and not re.match(r'^\d+(\s+\d+)*$', line) and "方向" not in line and not line.startswith("周"):
-                    current_station = line
-                    if current_station not in self.stations:
-                        self.stations[current_station] = {}
-                    continue
-                
-                # 检查是否是方向行
-                if "方向" in line:
-                    current_direction = line
-                    if current_direction not in self.stations[current_station]:
-                        self.stations[current_station][current_direction] = {}
-                    continue
-                
-                # 检查是否是星期行
-                if line.startswith("周"):
-                    current_days = line
-                    if current_days not in self.stations[current_station][current_direction]:
-                        self.stations[current_station][current_direction][current_days] = {}
-                    continue
-                
-                # 检查是否是表头行
-                if line.startswith("小时 |"):
-                    continue
-                
-                # 处理时间行
-                if re.match(r'^\d+(\s+\d+)*$', line):
-                    parts = line.split()
-                    
-                    if len(parts) >= 1:
-                        current_hour = int(parts[0])
-                        
-                        if current_hour not in self.stations[current_station][current_direction][current_days]:
-                            self.stations[current_station][current_direction][current_days][current_hour] = []
-                        
-                        # 如果有分钟数据
-                        if len(parts) > 1:
-                            for minute in parts[1:]:
-                                try:
-                                    minute_val = int(minute)
-                                    if 0 <= minute_val < 60:
-                                        self.stations[current_station][current_direction][current_days][current_hour].append(minute_val)
-                                except ValueError:
-                                    pass
-        
-        except Exception as e:
-            _LOGGER.error("解析配置文件时出错：%s", str(e))
-    
-    def get_stations(self):
-        """获取所有站点信息."""
-        return self.stations
-    
-    def get_next_times(self, station, direction, current_time=None):
-        """获取接下来的三趟地铁时间."""
-        if current_time is None:
-            current_time = dt_util.now()
-        
-        # 确定今天是周几
-        weekday = current_time.weekday()  # 0-6，0是周一
-        weekday_names = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
-        current_weekday = weekday_names[weekday]
-        
-        if station not in self.stations:
-            return []
-        
-        if direction not in self.stations[station]:
-            return []
-        
-        # 查找包含当前星期几的时刻表
-        days_key = None
-        for key in self.stations[station][direction]:
-            if key.startswith("周") and current_weekday in key:
-                days_key = key
-                break
-        
-        # 如果没找到匹配的时刻表，返回空列表
-        if days_key is None:
-            _LOGGER.warning("未找到站点 %s %s 星期 %s 的时刻表", station, direction, current_weekday)
-            return []
-        
-        schedule = self.stations[station][direction][days_key]
-        
-        current_hour = current_time.hour
-        current_minute = current_time.minute
-        
-        next_times = []
-        
-        # 查找当前小时及后续小时的班次
-        hours_to_check = list(range(current_hour, 24)) + list(range(0, current_hour))
-        
-        for hour in hours_to_check:
-            if hour in schedule:
-                for minute in sorted(schedule[hour]):
-                    # 如果是当前小时，只检查未来的分钟
-                    if hour == current_hour and minute <= current_minute:
-                        continue
-                    
-                    # 创建下一班车时间
-                    next_train_time = current_time.replace(hour=hour, minute=minute, second=0, microsecond=0)
-                    
-                    # 如果是明天的班次
-                    if hour < current_hour:
-                        next_train_time = next_train_time + timedelta(days=1)
-                    
-                    next_times.append(next_train_time)
-                    
-                    # 只取三趟车
-                    if len(next_times) >= 3:
-                        return next_times
-        
-        return next_times
-
 class SubwayTimingSensor(SensorEntity):
     """地铁到站时间传感器."""
     
-    def __init__(self, schedule_parser, station, direction, unique_id=None, entry_id=None):
+    def __init__(self, schedule_parser, station, direction, unique_id=None, entry_id=None,
+                 options=None, name=None):
         """初始化传感器."""
         self._schedule_parser = schedule_parser
         self._station = station
@@ -274,6 +201,7 @@ class SubwayTimingSensor(SensorEntity):
         self._entry_id = entry_id
         self._next_update_time = None
         self._unsub_update = None
+        self._apply_options(options or {})
         
         # 确保实体唯一ID正确设置
         self._attr_unique_id = unique_id or f"subway_timing_{station}_{direction}".lower().replace(" ", "_")
@@ -285,18 +213,44 @@ class SubwayTimingSensor(SensorEntity):
         self._attr_device_class = f"{station}"
         # 设置实体名称为方向名称
         self._attr_name = direction
+        # YAML 配置中指定的名称作为完整的实体名称
+        if name is not None:
+            self._attr_has_entity_name = False
+            self._attr_name = name
         self._attr_icon = "mdi:subway"
         
         _LOGGER.debug("创建传感器: %s, unique_id: %s", self._attr_name, self._attr_unique_id)
     
     async def async_added_to_hass(self):
         """当实体添加到 Home Assistant 时调用."""
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_TIMETABLE_UPDATED, self._async_timetable_updated
+            )
+        )
+        if self._entry_id is not None:
+            self.async_on_remove(
+                async_dispatcher_connect(
+                    self.hass,
+                    SIGNAL_OPTIONS_UPDATED.format(self._entry_id),
+                    self._async_options_updated,
+                )
+            )
         await self._update_and_schedule_next()
     
     async def async_will_remove_from_hass(self):
         """当实体从 Home Assistant 中移除时调用."""
         self._remove_scheduled_update()
     
+    @callback
+    def _async_timetable_updated(self, station=None, direction=None):
+        """时刻表重新加载后立即刷新."""
+        if station and station != self._station:
+            return
+        if direction and direction != self._direction:
+            return
+        self.hass.async_create_task(self._update_and_schedule_next())
+    
     @callback
     def _remove_scheduled_update(self):
         """移除计划的更新."""
@@ -313,48 +267,64 @@ class SubwayTimingSensor(SensorEntity):
         self.async_write_ha_state()
         
         # 安排下一次更新
-        next_update_in = self._calculate_update_interval()
-        next_update = dt_util.utcnow() + timedelta(seconds=next_update_in)
+        next_update = self._calculate_next_update()
+        
+        if next_update is None:
+            _LOGGER.debug("%s: 时刻表不会再变化，暂停定时更新", self.name)
+            return
         
         _LOGGER.debug(
-            "%s: 安排下一次更新在 %s 秒后 (%s)",
+            "%s: 安排下一次更新在 %s",
             self.name,
-            next_update_in,
             next_update
         )
         
-        self._unsub_update = async_track_point_in_utc_time(
-            self.hass, self._update_and_schedule_next, next_update
+        self._unsub_update = async_get_update_scheduler(self.hass).async_schedule(
+            next_update, self._update_and_schedule_next, self._coalesce_slack
         )
     
-    def _calculate_update_interval(self):
-        """计算下一次更新时间间隔."""
-        next_times = self._schedule_parser.get_next_times(
-            self._station, self._direction)
+    def _calculate_next_update(self):
+        """根据更新策略计算下一次更新时间."""
+        now = dt_util.now()
+        next_times = self._get_next_times(now)
+        schedule_change = self._schedule_parser.get_next_schedule_change(
+            self._station, self._direction, now)
         
         if not next_times:
-            # 如果没有班次，每10分钟检查一次
-            return 600
+            # 如果没有班次，休眠到下一个有班次的日期
+            return schedule_change
         
-        # 计算下一班列车的等待时间（秒）
-        wait_seconds = (next_times[0] - dt_util.now()).total_seconds()
+        next_update = self._policy.next_update(
+            now, next_times[0], self._next_transition(now, next_times))
         
-        # 根据等待时间调整更新频率
-        if wait_seconds < 60:  # 少于1分钟
-            return 10  # 每10秒更新一次
-        elif wait_seconds < 300:  # 少于5分钟
-            return 30  # 每30秒更新一次
-        elif wait_seconds < 900:  # 少于15分钟
-            return 60  # 每1分钟更新一次
-        elif wait_seconds < 1800:  # 少于30分钟
-            return 120  # 每2分钟更新一次
-        else:
-            return 300  # 每5分钟更新一次
+        # 时刻表切换时需要立即更新
+        if schedule_change is not None and schedule_change < next_update:
+            return schedule_change
+        return next_update
+    
+    def _get_next_times(self, now=None):
+        """获取叠加实时延误后的接下来三趟列车时间."""
+        return async_get_overlay(self.hass).get_next_times(
+            self._schedule_parser, self._station, self._direction, now)
+    
+    def _next_transition(self, now, next_times):
+        """返回状态下一次发生变化的时间，即等待分钟数变化的整分钟时刻."""
+        return now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    
+    @callback
+    def _async_options_updated(self, options):
+        """选项变更后立即应用新的更新策略."""
+        self._apply_options(options)
+        self.hass.async_create_task(self._update_and_schedule_next())
+    
+    def _apply_options(self, options):
+        """根据选项设置更新策略."""
+        self._policy = build_policy(options)
+        self._coalesce_slack = get_coalesce_slack(options)
     
     async def async_update(self):
         """更新状态."""
-        next_times = self._schedule_parser.get_next_times(
-            self._station, self._direction)
+        next_times = self._get_next_times()
         
         if not next_times:
             self._state = "无班次"
@@ -427,3 +397,59 @@ class SubwayTimingSensor(SensorEntity):
             "manufacturer": "Subway Timing",
             "model": self._direction,
         }
+
+
+class SubwayTimingTimestampSensor(SubwayTimingSensor):
+    """以下一班列车发车时间为状态的地铁传感器.
+
+    状态为时间戳，由前端自行计算倒计时，服务端只需在列车发车时写入一次状态。
+    """
+    
+    def __init__(self, schedule_parser, station, direction, unique_id=None, entry_id=None,
+                 options=None, name=None):
+        """初始化传感器."""
+        super().__init__(
+            schedule_parser, station, direction, unique_id, entry_id, options, name)
+        self._attr_device_class = SensorDeviceClass.TIMESTAMP
+        self._attr_icon = "mdi:subway-variant"
+    
+    def _apply_options(self, options):
+        """根据选项设置更新策略，时间戳只在列车发车时变化."""
+        super()._apply_options(options)
+        self._policy = ExactTransitionPolicy()
+    
+    def _next_transition(self, now, next_times):
+        """返回状态下一次发生变化的时间，即下一班列车发车时刻."""
+        return next_times[0]
+    
+    async def async_update(self):
+        """更新状态."""
+        next_times = self._get_next_times()
+        
+        self._state = dt_util.as_utc(next_times[0]) if next_times else None
+        
+        next_trains_info = [
+            {
+                ATTR_DEPARTURE_TIME: train_time.strftime("%H:%M"),
+                ATTR_DEPARTURE: train_time.isoformat(),
+            }
+            for train_time in next_times
+        ]
+        
+        self._attrs = {
+            ATTR_STATION: self._station,
+            ATTR_DIRECTION: self._direction,
+            ATTR_NEXT_TRAINS: next_trains_info,
+            ATTR_LAST_UPDATED: dt_util.now().isoformat(),
+        }
+        
+        # 添加独立的未来三趟列车时间属性，不包含会随时间变化的等待时间
+        for i, train_info in enumerate(next_trains_info[:3], 1):
+            self._attrs[f"next_train_{i}_time"] = train_info[ATTR_DEPARTURE_TIME]
+    
+    @property
+    def state(self):
+        """返回传感器状态."""
+        if self._state is None:
+            return None
+        return self._state.isoformat()
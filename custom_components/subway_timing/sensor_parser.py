@@ -1,23 +1,66 @@
 """Parser for subway schedule."""
 import logging
+import os
 import re
 from datetime import datetime, timedelta
 
 from homeassistant.util import dt as dt_util
 
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+
+from .const import DOMAIN, DATA_PARSERS, SIGNAL_TIMETABLE_UPDATED
+from .timetable import MINUTES_PER_DAY, HeadwayTimetable
+
 _LOGGER = logging.getLogger(__name__)
 
+WEEKDAY_NAMES = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+
+
+async def async_get_schedule_parser(hass, conf_path):
+    """获取共享的时刻表解析器，同一配置文件只解析一次，文件变化时重新解析."""
+    parsers = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_PARSERS, {})
+    parser = parsers.get(conf_path)
+    
+    if parser is None:
+        parser = await hass.async_add_executor_job(SubwayScheduleParser, conf_path)
+        return parsers.setdefault(conf_path, parser)
+    
+    if await hass.async_add_executor_job(parser.is_stale):
+        await hass.async_add_executor_job(parser.reload)
+        async_dispatcher_send(hass, SIGNAL_TIMETABLE_UPDATED, None, None)
+    
+    return parser
+
 class SubwayScheduleParser:
     """解析地铁时刻表配置文件."""
     
     def __init__(self, config_file):
         """初始化解析器."""
         self.config_file = config_file
-        self.stations = {}
-        self._parse_schedule()
+        self.version = 0
+        self._mtime = self._get_mtime()
+        self.stations = self._parse_schedule()
+    
+    def reload(self):
+        """重新解析时刻表文件."""
+        self._mtime = self._get_mtime()
+        self.stations = self._parse_schedule()
+        self.version += 1
+    
+    def _get_mtime(self):
+        """获取时刻表文件的修改时间."""
+        try:
+            return os.path.getmtime(self.config_file)
+        except OSError:
+            return None
+    
+    def is_stale(self):
+        """检查时刻表文件在上次解析后是否被修改."""
+        return self._get_mtime() != self._mtime
     
     def _parse_schedule(self):
         """解析时刻表文件."""
+        stations = {}
         try:
             with open(self.config_file, "r", encoding="utf-8") as f:
                 content = f.readlines()
@@ -38,22 +81,22 @@ class SubwayScheduleParser:
                 # 检查是否是站点名行
                 if not line.startswith("小时 |") and not re.match(r'^\d+(\s+\d+)*$', line) and "方向" not in line and not line.startswith("周"):
                     current_station = line
-                    if current_station not in self.stations:
-                        self.stations[current_station] = {}
+                    if current_station not in stations:
+                        stations[current_station] = {}
                     continue
                 
                 # 检查是否是方向行
                 if "方向" in line:
                     current_direction = line
-                    if current_direction not in self.stations[current_station]:
-                        self.stations[current_station][current_direction] = {}
+                    if current_direction not in stations[current_station]:
+                        stations[current_station][current_direction] = {}
                     continue
                 
                 # 检查是否是星期行
                 if line.startswith("周"):
                     current_days = line
-                    if current_days not in self.stations[current_station][current_direction]:
-                        self.stations[current_station][current_direction][current_days] = {}
+                    if current_days not in stations[current_station][current_direction]:
+                        stations[current_station][current_direction][current_days] = {}
                     continue
                 
                 # 检查是否是表头行
@@ -67,8 +110,8 @@ class SubwayScheduleParser:
                     if len(parts) >= 1:
                         current_hour = int(parts[0])
                         
-                        if current_hour not in self.stations[current_station][current_direction][current_days]:
-                            self.stations[current_station][current_direction][current_days][current_hour] = []
+                        if current_hour not in stations[current_station][current_direction][current_days]:
+                            stations[current_station][current_direction][current_days][current_hour] = []
                         
                         # 如果有分钟数据
                         if len(parts) > 1:
@@ -76,26 +119,96 @@ class SubwayScheduleParser:
                                 try:
                                     minute_val = int(minute)
                                     if 0 <= minute_val < 60:
-                                        self.stations[current_station][current_direction][current_days][current_hour].append(minute_val)
+                                        stations[current_station][current_direction][current_days][current_hour].append(minute_val)
                                 except ValueError:
                                     pass
         
         except Exception as e:
             _LOGGER.error("解析配置文件时出错：%s", str(e))
+        
+        return self._compile(stations)
+    
+    def _compile(self, stations):
+        """将按小时记录的分钟数编译为压缩时刻表."""
+        for directions in stations.values():
+            for day_sets in directions.values():
+                for days_key, schedule in day_sets.items():
+                    day_sets[days_key] = HeadwayTimetable(
+                        hour * 60 + minute
+                        for hour, minutes in schedule.items()
+                        if 0 <= hour < 24
+                        for minute in minutes
+                    )
+        return stations
     
     def get_stations(self):
         """获取所有站点信息."""
         return self.stations
     
-    def get_next_times(self, station, direction, current_time=None):
-        """获取接下来的三趟地铁时间."""
+    def get_summary(self):
+        """获取时刻表概况：站点、方向和发车班次数量."""
+        directions = 0
+        departures = 0
+        for station_directions in self.stations.values():
+            directions += len(station_directions)
+            for day_sets in station_directions.values():
+                departures += sum(len(timetable) for timetable in day_sets.values())
+        
+        return {
+            "stations": len(self.stations),
+            "directions": directions,
+            "departures": departures,
+        }
+    
+    def _find_days_key(self, station, direction, weekday):
+        """查找包含指定星期几的时刻表键."""
+        current_weekday = WEEKDAY_NAMES[weekday]
+        for key in self.stations.get(station, {}).get(direction, {}):
+            if key.startswith("周") and current_weekday in key:
+                return key
+        return None
+    
+    def get_segments(self, station, direction, day):
+        """获取指定日期压缩后的时刻表段，格式见 HeadwayTimetable.as_segments."""
+        days_key = self._find_days_key(station, direction, day.weekday())
+        if days_key is None:
+            return []
+        
+        return self.stations[station][direction][days_key].as_segments()
+    
+    def has_departure(self, station, direction, when):
+        """检查指定时间是否为时刻表中的班次."""
+        days_key = self._find_days_key(station, direction, when.weekday())
+        if days_key is None:
+            return False
+        
+        minute = when.hour * 60 + when.minute
+        return bool(self.stations[station][direction][days_key].take(minute, minute + 1, 1))
+    
+    def get_next_schedule_change(self, station, direction, current_time=None):
+        """获取下一次切换时刻表的时间.
+        
+        即之后第一个适用时刻表与当天不同的日期的零点：当天没有班次时为下一个
+        有班次日期的零点，当天有班次时为工作日、周末等时刻表切换的零点。
+        一周内都不会切换时返回 None。
+        """
         if current_time is None:
             current_time = dt_util.now()
         
-        # 确定今天是周几
-        weekday = current_time.weekday()  # 0-6，0是周一
-        weekday_names = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
-        current_weekday = weekday_names[weekday]
+        today = current_time.date()
+        today_key = self._find_days_key(station, direction, today.weekday())
+        
+        for days_ahead in range(1, 8):
+            day = today + timedelta(days=days_ahead)
+            if self._find_days_key(station, direction, day.weekday()) != today_key:
+                return dt_util.start_of_local_day(day)
+        
+        return None
+    
+    def get_next_times(self, station, direction, current_time=None, count=3):
+        """获取接下来的几趟地铁时间，默认三趟."""
+        if current_time is None:
+            current_time = dt_util.now()
         
         if station not in self.stations:
             return []
@@ -103,45 +216,33 @@ class SubwayScheduleParser:
         if direction not in self.stations[station]:
             return []
         
-        # 查找包含当前星期几的时刻表
-        days_key = None
-        for key in self.stations[station][direction]:
-            if key.startswith("周") and current_weekday in key:
-                days_key = key
-                break
+        days_key = self._find_days_key(station, direction, current_time.weekday())
         
         if days_key is None:
-            _LOGGER.warning("未找到站点 %s %s 星期 %s 的时刻表", station, direction, current_weekday)
+            _LOGGER.warning("未找到站点 %s %s 星期 %s 的时刻表",
+                            station, direction, WEEKDAY_NAMES[current_time.weekday()])
             return []
         
-        schedule = self.stations[station][direction][days_key]
+        timetable = self.stations[station][direction][days_key]
         
         current_hour = current_time.hour
-        current_minute = current_time.minute
+        minute_of_day = current_time.hour * 60 + current_time.minute
         
         next_times = []
         
-        # 查找当前小时及后续小时的班次
-        hours_to_check = list(range(current_hour, 24)) + list(range(0, current_hour))
+        # 查找当前分钟之后的班次，不足时补充明天当前小时之前的班次
+        today_minutes = timetable.take(minute_of_day + 1, MINUTES_PER_DAY, count)
+        tomorrow_minutes = timetable.take(0, current_hour * 60, count - len(today_minutes))
         
-        for hour in hours_to_check:
-            if hour in schedule:
-                for minute in sorted(schedule[hour]):
-                    # 如果是当前小时，只检查未来的分钟
-                    if hour == current_hour and minute <= current_minute:
-                        continue
-                    
-                    # 创建下一班车时间
-                    next_train_time = current_time.replace(hour=hour, minute=minute, second=0, microsecond=0)
-                    
-                    # 如果是明天的班次
-                    if hour < current_hour:
-                        next_train_time = next_train_time + timedelta(days=1)
-                    
-                    next_times.append(next_train_time)
-                    
-                    # 只取三趟车
-                    if len(next_times) >= 3:
-                        return next_times
+        for minute in today_minutes:
+            # 创建下一班车时间
+            next_times.append(current_time.replace(
+                hour=minute // 60, minute=minute % 60, second=0, microsecond=0))
+        
+        for minute in tomorrow_minutes:
+            # 明天的班次
+            next_train_time = current_time.replace(
+                hour=minute // 60, minute=minute % 60, second=0, microsecond=0)
+            next_times.append(next_train_time + timedelta(days=1))
         
         return next_times
@@ -0,0 +1,173 @@
+"""Headway-compressed daily timetable."""
+from array import array
+from bisect import bisect_left, bisect_right
+
+MINUTES_PER_DAY = 24 * 60
+
+# 至少连续这么多班次间隔相同才压缩为固定间隔段
+MIN_SEGMENT_LENGTH = 3
+
+
+class HeadwayTimetable:
+    """一天的发车时刻，以当天零点起的分钟数表示.
+
+    间隔固定的连续班次存储为 (起始, 结束, 间隔) 段，其余班次按原样存入数组。
+    段内查找下一班次通过算术计算完成，不需要逐个比较。
+    """
+
+    __slots__ = ("_starts", "_ends", "_headways", "_offsets", "_explicit", "_count")
+
+    def __init__(self, departures):
+        """根据发车分钟数编译时刻表."""
+        departures = sorted(set(departures))
+        self._starts = array("H")
+        self._ends = array("H")
+        # 间隔为0的段表示不规则班次，存放在 _explicit 中从 _offsets 开始的位置
+        self._headways = array("H")
+        self._offsets = array("H")
+        self._explicit = array("H")
+        self._count = len(departures)
+
+        pending = []
+        index = 0
+        while index < len(departures):
+            end = index
+            if index + 1 < len(departures):
+                headway = departures[index + 1] - departures[index]
+                end = index + 1
+                while (
+                    end + 1 < len(departures)
+                    and departures[end + 1] - departures[end] == headway
+                ):
+                    end += 1
+
+            if end - index + 1 >= MIN_SEGMENT_LENGTH:
+                self._add_explicit(pending)
+                self._add_segment(departures[index], departures[end], headway)
+                index = end + 1
+            else:
+                pending.append(departures[index])
+                index += 1
+
+        self._add_explicit(pending)
+
+    def _add_segment(self, start, end, headway):
+        """添加固定间隔段."""
+        self._starts.append(start)
+        self._ends.append(end)
+        self._headways.append(headway)
+        self._offsets.append(len(self._explicit))
+
+    def _add_explicit(self, pending):
+        """将不规则班次作为一个显式段添加."""
+        if not pending:
+            return
+        self._add_segment(pending[0], pending[-1], 0)
+        self._explicit.extend(pending)
+        pending.clear()
+
+    def __len__(self):
+        """返回班次数量."""
+        return self._count
+
+    def __iter__(self):
+        """按时间顺序遍历全部班次."""
+        return self.iter_range(0, MINUTES_PER_DAY)
+
+    def iter_range(self, start, end):
+        """按时间顺序遍历 [start, end) 范围内的班次."""
+        segment = max(bisect_right(self._starts, start) - 1, 0)
+
+        for segment in range(segment, len(self._starts)):
+            first = self._starts[segment]
+            if first >= end:
+                return
+            last = min(self._ends[segment], end - 1)
+            if last < start:
+                continue
+
+            headway = self._headways[segment]
+            if headway:
+                # 段内按间隔直接计算第一个不早于 start 的班次
+                if start > first:
+                    first += -(-(start - first) // headway) * headway
+                yield from range(first, last + 1, headway)
+            else:
+                stop = (
+                    self._offsets[segment + 1]
+                    if segment + 1 < len(self._offsets)
+                    else len(self._explicit)
+                )
+                position = bisect_left(self._explicit, start, self._offsets[segment], stop)
+                for departure in self._explicit[position:stop]:
+                    if departure > last:
+                        return
+                    yield departure
+
+    def take(self, start, end, count):
+        """返回 [start, end) 范围内最早的 count 个班次."""
+        result = []
+        if count <= 0:
+            return result
+
+        starts = self._starts
+        ends = self._ends
+        headways = self._headways
+        segment = bisect_right(starts, start) - 1
+        if segment < 0:
+            segment = 0
+
+        while segment < len(starts):
+            first = starts[segment]
+            if first >= end:
+                break
+            last = ends[segment]
+            if last >= end:
+                last = end - 1
+
+            if last >= start:
+                headway = headways[segment]
+                if headway:
+                    # 段内按间隔直接计算第一个不早于 start 的班次
+                    if start > first:
+                        first += (start - first + headway - 1) // headway * headway
+                    limit = first + (count - len(result) - 1) * headway
+                    if limit < last:
+                        last = limit
+                    result += range(first, last + 1, headway)
+                else:
+                    self._take_explicit(segment, start, last, count, result)
+                if len(result) >= count:
+                    break
+
+            segment += 1
+
+        return result
+
+    def _take_explicit(self, segment, start, last, count, result):
+        """从显式段中取出不早于 start 且不晚于 last 的班次."""
+        explicit = self._explicit
+        stop = (
+            self._offsets[segment + 1]
+            if segment + 1 < len(self._offsets)
+            else len(explicit)
+        )
+        position = bisect_left(explicit, start, self._offsets[segment], stop)
+        while position < stop and len(result) < count and explicit[position] <= last:
+            result.append(explicit[position])
+            position += 1
+
+    def as_segments(self):
+        """返回可序列化的段列表.
+
+        固定间隔段为 [起始, 结束, 间隔]；不规则班次段的间隔为0，其后依次列出各班次，
+        即 [起始, 结束, 0, 班次...]。
+        """
+        segments = []
+        for segment, start in enumerate(self._starts):
+            end = self._ends[segment]
+            headway = self._headways[segment]
+            segments.append([start, end, headway])
+            if not headway:
+                segments[-1].extend(self.iter_range(start, end + 1))
+        return segments
@@ -0,0 +1,103 @@
+"""HTTP view serving precompiled subway timetables."""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from aiohttp import web
+
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    DOMAIN,
+    DATA_PARSERS,
+    TIMETABLE_URL,
+    TIMETABLE_VIEW_NAME,
+    TIMETABLE_BUNDLE_VERSION,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SubwayTimetableView(HomeAssistantView):
+    """提供今明两天发车时刻的时刻表数据包.
+
+    发车时间以当地零点起的分钟数表示，间隔固定的班次压缩为 [起始, 结束, 间隔]，
+    其余班次为 [起始, 结束, 0, 班次...]。前端可据此自行计算下一班列车，
+    只需在 valid_until（服务日切换）或时刻表重新加载后再次请求。
+    """
+
+    url = TIMETABLE_URL
+    name = TIMETABLE_VIEW_NAME
+
+    def __init__(self):
+        """初始化视图."""
+        self._cache_key = None
+        self._body = None
+        self._etag = None
+
+    async def get(self, request):
+        """返回时刻表数据包，支持 ETag 协商缓存."""
+        hass = request.app["hass"]
+        body, etag = self._get_bundle(hass)
+
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "private, no-cache",
+        }
+
+        if_none_match = request.headers.get("If-None-Match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")):
+            return web.Response(status=304, headers=headers)
+
+        return web.Response(
+            body=body,
+            content_type="application/json",
+            charset="utf-8",
+            headers=headers,
+        )
+
+    def _get_bundle(self, hass):
+        """获取缓存的数据包，服务日或时刻表变化时重新生成."""
+        parsers = hass.data.get(DOMAIN, {}).get(DATA_PARSERS, {})
+        today = dt_util.now().date()
+        cache_key = (
+            today,
+            tuple((path, parser.version) for path, parser in parsers.items()),
+        )
+
+        if cache_key != self._cache_key:
+            bundle = _build_bundle(hass, parsers, today)
+            self._body = json.dumps(
+                bundle, ensure_ascii=False, separators=(",", ":")
+            ).encode("utf-8")
+            self._etag = f'"{hashlib.sha1(self._body).hexdigest()[:16]}"'
+            self._cache_key = cache_key
+            _LOGGER.debug("重新生成时刻表数据包: %s 字节", len(self._body))
+
+        return self._body, self._etag
+
+
+def _build_bundle(hass, parsers, today):
+    """生成今明两天的时刻表数据包."""
+    tomorrow = today + timedelta(days=1)
+    timetables = []
+
+    for parser in parsers.values():
+        for station, directions in parser.get_stations().items():
+            for direction in directions:
+                timetables.append({
+                    "station": station,
+                    "direction": direction,
+                    "today": parser.get_segments(station, direction, today),
+                    "tomorrow": parser.get_segments(station, direction, tomorrow),
+                })
+
+    return {
+        "version": TIMETABLE_BUNDLE_VERSION,
+        "time_zone": hass.config.time_zone,
+        "service_day": today.isoformat(),
+        "valid_until": dt_util.start_of_local_day(tomorrow).isoformat(),
+        "timetables": timetables,
+    }